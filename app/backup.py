@@ -0,0 +1,213 @@
+"""
+Point-in-time export and restore of a user's capsule (`data/{user_id}/`).
+
+Usage:
+    python -m app.backup export <user_id> [-o capsule.tar]
+    python -m app.backup restore <user_id> capsule.tar
+"""
+import os
+import sys
+import json
+import shutil
+import tarfile
+import argparse
+import tempfile
+
+import faiss # type: ignore
+
+from app.storage import (
+    DATA_DIR,
+    _user_base,
+    _entries_dir,
+    _index_path,
+    _id_map_path,
+    _meta_path,
+    _user_lock,
+    get_index_version,
+)
+
+# Multiple of the tar block size, so file data is read in large aligned chunks
+CHUNK_SIZE = 1 << 20
+
+def _scratch_dir() -> str:
+    """Scratch space on the same filesystem as DATA_DIR, so hard links and renames work."""
+    path = os.path.join(DATA_DIR, ".snapshots")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def snapshot(user_id: str) -> str:
+    """
+    Capture a consistent view of the user's capsule in a scratch directory
+    and return its path; the caller removes it.
+    Index, id map and meta are copied under the user lock. save_entry
+    creates entry files exclusively and never rewrites them, so they are
+    hard-linked instead of copied.
+    """
+    base = _user_base(user_id)
+    if not os.path.isdir(base):
+        raise FileNotFoundError(f"No capsule for user {user_id}")
+
+    root = tempfile.mkdtemp(prefix=f"{user_id}-", dir=_scratch_dir())
+    try:
+        with _user_lock(user_id, shared=True):
+            for dirpath, _, files in os.walk(base):
+                rel_dir = os.path.relpath(dirpath, base)
+                os.makedirs(os.path.join(root, rel_dir), exist_ok=True)
+                for fn in files:
+                    src = os.path.join(dirpath, fn)
+                    dst = os.path.join(root, rel_dir, fn)
+                    if dirpath == _entries_dir(user_id):
+                        try:
+                            os.link(src, dst)
+                            continue
+                        except OSError:
+                            pass  # e.g. filesystem without hard links
+                    shutil.copy2(src, dst)
+    except BaseException:
+        shutil.rmtree(root, ignore_errors=True)
+        raise
+    return root
+
+def iter_tar(root: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Yield an uncompressed tar archive of `root` as byte chunks.
+    Headers are built per file and file data is streamed in `chunk_size`
+    reads, so memory use stays constant regardless of file sizes.
+    """
+    written = 0
+    for dirpath, dirs, files in os.walk(root):
+        dirs.sort()
+        for fn in sorted(files):
+            path = os.path.join(dirpath, fn)
+            st = os.stat(path)
+            info = tarfile.TarInfo(os.path.relpath(path, root))
+            info.size = st.st_size
+            info.mtime = int(st.st_mtime)
+            info.mode = 0o644
+            header = info.tobuf(format=tarfile.PAX_FORMAT)
+            yield header
+            with open(path, "rb") as f:
+                while chunk := f.read(chunk_size):
+                    yield chunk
+            padding = -info.size % tarfile.BLOCKSIZE
+            if padding:
+                yield tarfile.NUL * padding
+            written += len(header) + info.size + padding
+
+    # End-of-archive marker, padded to a full record like tarfile does
+    end = 2 * tarfile.BLOCKSIZE
+    end += -(written + end) % tarfile.RECORDSIZE
+    yield tarfile.NUL * end
+
+def export_capsule(user_id: str):
+    """
+    Snapshot the user's capsule and yield it as a tar stream.
+    The snapshot is taken immediately, before the first chunk is requested.
+    """
+    root = snapshot(user_id)
+
+    def stream():
+        try:
+            yield from iter_tar(root)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return stream()
+
+def _validate_capsule(user_id: str, root: str):
+    """Check that an unpacked capsule's index, id map and entries agree."""
+    def rel(path):
+        return os.path.join(root, os.path.relpath(path, _user_base(user_id)))
+
+    if not os.path.exists(rel(_meta_path(user_id))):
+        raise ValueError("Archive has no meta.json")
+    index_file, id_map_file = rel(_index_path(user_id)), rel(_id_map_path(user_id))
+    if not os.path.exists(index_file):
+        return  # capsule without any indexed entries
+    if not os.path.exists(id_map_file):
+        raise ValueError("Archive has an index but no id map")
+
+    index = faiss.read_index(index_file)
+    with open(id_map_file, "r") as f:
+        id_map = json.load(f)
+    if len(id_map) != index.ntotal:
+        raise ValueError(f"id map has {len(id_map)} ids but index has {index.ntotal} vectors")
+    entries_dir = rel(_entries_dir(user_id))
+    for entry_id in set(id_map.values()):
+        if not os.path.exists(os.path.join(entries_dir, f"{entry_id}.txt")):
+            raise ValueError(f"Archive is missing entry {entry_id}")
+
+def restore_capsule(user_id: str, fileobj):
+    """
+    Replace the user's capsule with the tar archive read from `fileobj`.
+    The archive is streamed into a staging directory and validated, then
+    swapped in under the user lock. The FAISS index is restored as-is,
+    so nothing is re-embedded.
+    """
+    staging = tempfile.mkdtemp(prefix=f"{user_id}-restore-", dir=_scratch_dir())
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+            for member in tar:
+                name = os.path.normpath(member.name)
+                if name.startswith("..") or os.path.isabs(name):
+                    raise ValueError(f"Unsafe path in archive: {member.name}")
+                if member.isdir():
+                    continue
+                if not member.isfile():
+                    raise ValueError(f"Unsupported archive member: {member.name}")
+                dst = os.path.join(staging, name)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                with tar.extractfile(member) as src, open(dst, "wb") as out:
+                    shutil.copyfileobj(src, out, CHUNK_SIZE)
+
+        _validate_capsule(user_id, staging)
+
+        with _user_lock(user_id):
+            # Move the version forward past both capsules, so cached results
+            # for either never match the restored index
+            meta_file = os.path.join(staging, os.path.relpath(_meta_path(user_id), _user_base(user_id)))
+            with open(meta_file, "r") as f:
+                meta = json.load(f)
+            meta["version"] = max(meta.get("version", 0), get_index_version(user_id)) + 1
+            with open(meta_file, "w") as f:
+                json.dump(meta, f, indent=2)
+
+            base = _user_base(user_id)
+            trash = None
+            if os.path.exists(base):
+                trash = tempfile.mkdtemp(prefix=f"{user_id}-old-", dir=_scratch_dir())
+                os.rename(base, os.path.join(trash, "capsule"))
+            os.rename(staging, base)
+        if trash:
+            shutil.rmtree(trash, ignore_errors=True)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_p = sub.add_parser("export", help="Write a snapshot of a user's capsule as a tar archive")
+    export_p.add_argument("user_id")
+    export_p.add_argument("-o", "--output", help="Archive path (default: stdout)")
+    restore_p = sub.add_parser("restore", help="Replace a user's capsule with a tar archive")
+    restore_p.add_argument("user_id")
+    restore_p.add_argument("archive", help="Archive path, or - for stdin")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        out = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            for chunk in export_capsule(args.user_id):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    else:
+        if args.archive == "-":
+            restore_capsule(args.user_id, sys.stdin.buffer)
+        else:
+            with open(args.archive, "rb") as f:
+                restore_capsule(args.user_id, f)
+
+if __name__ == "__main__":
+    main()
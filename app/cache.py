@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Hashable
+
+FLASHBACK_CACHE_SIZE = int(os.getenv("FLASHBACK_CACHE_SIZE", 1024))
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with single-flight coalescing: concurrent callers
+    asking for the same missing key wait for one computation instead of
+    each running their own.
+    Keys should embed whatever version makes old results stale, so stale
+    entries are simply never hit again and age out of the LRU.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "errors": 0}
+
+    def get_or_compute(self, key: Hashable, compute: Callable):
+        """
+        Return the cached value for `key`, or run `compute()` once and cache it.
+        Errors are passed to every waiting caller and are not cached.
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._items[key]
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                future = self._inflight[key] = Future()
+                self._stats["misses"] += 1
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+                self._stats["errors"] += 1
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._inflight[key]
+            self._items[key] = value
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self._stats["evictions"] += 1
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"] + self._stats["coalesced"]
+            return {
+                **self._stats,
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "inflight": len(self._inflight),
+                "hit_rate": (self._stats["hits"] + self._stats["coalesced"]) / lookups if lookups else 0.0,
+            }
+
+flashback_cache = ResultCache(FLASHBACK_CACHE_SIZE)
@@ -1,5 +1,11 @@
 import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
 import subprocess
+from collections import deque
 from huggingface_hub import InferenceClient # type: ignore
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from peft import PeftModel # type: ignore
@@ -10,32 +16,264 @@ BASE_MODEL = os.getenv("BASE_MODEL")
 HF_ORG = os.getenv("HF_ORG")
 ADAPTERS_DIR = os.getenv("ADAPTERS_DIR")
 
+# Generation gateway limits
+GEN_PROVIDER = os.getenv("GEN_PROVIDER", "hf")  # "hf" or "fake" (local, no network)
+GEN_MAX_CONCURRENCY = int(os.getenv("GEN_MAX_CONCURRENCY", 4))
+GEN_MAX_QUEUE = int(os.getenv("GEN_MAX_QUEUE", 32))
+GEN_DEADLINE_S = float(os.getenv("GEN_DEADLINE_S", 20))
+GEN_BREAKER_WINDOW = int(os.getenv("GEN_BREAKER_WINDOW", 20))
+GEN_BREAKER_MIN_CALLS = int(os.getenv("GEN_BREAKER_MIN_CALLS", 5))
+GEN_BREAKER_ERROR_RATE = float(os.getenv("GEN_BREAKER_ERROR_RATE", 0.5))
+GEN_BREAKER_SLOW_S = float(os.getenv("GEN_BREAKER_SLOW_S", 10))  # slower calls count as failures
+GEN_BREAKER_COOLDOWN_S = float(os.getenv("GEN_BREAKER_COOLDOWN_S", 30))
+
 # Setup Hugging Face API client
+# The timeout bounds how long a gateway slot can be held by a hung call:
+# the call is shielded past the request deadline until the worker thread returns.
 client = InferenceClient(
     provider="featherless-ai",
     api_key=HF_TOKEN,
+    timeout=GEN_DEADLINE_S,
 )
 
-async def generate_entry(user_id: str, raw_block: str) -> str:
+class GenerationUnavailable(Exception):
+    """Raised when the gateway sheds, times out or fails fast a generation request."""
+
+class CircuitBreaker:
     """
-    1. Determine Adapter Repo for User
-    2. Call HF Inference Endpoint with adapter parameter
-    3. Return generated text
+    Opens when, over the last `window` calls, the share of failed or slow
+    calls reaches `error_rate`. While open, calls are refused; after
+    `cooldown_s` one probe call is let through (half-open) and its outcome
+    closes or re-opens the breaker.
+    """
+
+    def __init__(self, window: int, min_calls: int, error_rate: float, slow_s: float,
+                 cooldown_s: float, clock=time.monotonic):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_s = slow_s
+        self.cooldown_s = cooldown_s
+        self.clock = clock
+        self.state = "closed"
+        self.trips = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if self.clock() - self._opened_at < self.cooldown_s:
+                return False
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def abandon(self):
+        """Give back a half-open probe that never reached the provider."""
+        if self.state == "half_open":
+            self._probing = False
+
+    def record(self, ok: bool, latency: float):
+        ok = ok and latency <= self.slow_s
+        if self.state == "half_open":
+            self._probing = False
+            if ok:
+                self.state = "closed"
+                self._outcomes.clear()
+            else:
+                self._trip()
+            return
+        if self.state == "open":
+            return  # stragglers from before the trip
+        self._outcomes.append(ok)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+            self._trip()
+
+    def _trip(self):
+        self.state = "open"
+        self.trips += 1
+        self._opened_at = self.clock()
+        self._outcomes.clear()
+
+class GenerationGateway:
+    """
+    Admission control in front of a generation provider
+    (`async provider(user_id, raw_block) -> str`):
+      - at most `max_concurrency` provider calls run at once
+      - waiting requests are served by priority (lower first), then
+        round-robin across users, and shed once `max_queue` are waiting
+      - each request must finish (queueing included) within its deadline
+      - a CircuitBreaker fails requests fast while the provider is degraded
+    Refused requests raise GenerationUnavailable so callers can fall back.
+    """
+
+    def __init__(self, provider, max_concurrency: int, max_queue: int, deadline_s: float,
+                 breaker: CircuitBreaker, clock=time.monotonic):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.deadline_s = deadline_s
+        self.breaker = breaker
+        self.clock = clock
+        self._active = 0
+        self._heap = []
+        self._queued = 0
+        self._waiting = {}  # user_id -> number of queued requests
+        self._seq = itertools.count()
+        self._counts = {"completed": 0, "failed": 0, "timed_out": 0, "shed": 0, "rejected_open": 0}
+
+    async def generate(self, user_id: str, raw_block: str, priority: int = 0, deadline_s: float = None) -> str:
+        deadline = self.clock() + (self.deadline_s if deadline_s is None else deadline_s)
+        if not self.breaker.allow():
+            self._counts["rejected_open"] += 1
+            raise GenerationUnavailable("generation circuit open")
+
+        try:
+            await asyncio.wait_for(self._acquire(user_id, priority), max(0.0, deadline - self.clock()))
+        except asyncio.TimeoutError:
+            self._counts["timed_out"] += 1
+            self.breaker.abandon()
+            raise GenerationUnavailable("timed out waiting for a generation slot")
+        except GenerationUnavailable:
+            self.breaker.abandon()
+            raise
+
+        # The provider call is shielded so the slot stays held until it really
+        # finishes, even if this request gives up at its deadline.
+        started = self.clock()
+        outcome = {"recorded": False}
+        task = asyncio.ensure_future(self.provider(user_id, raw_block))
+
+        def _done(t):
+            self._release()
+            if not outcome["recorded"]:
+                failed = t.cancelled() or t.exception() is not None
+                self.breaker.record(not failed, self.clock() - started)
+                self._counts["failed" if failed else "completed"] += 1
+
+        task.add_done_callback(_done)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(0.0, deadline - self.clock()))
+        except asyncio.TimeoutError:
+            outcome["recorded"] = True
+            self._counts["timed_out"] += 1
+            self.breaker.record(False, self.clock() - started)
+            raise GenerationUnavailable("generation deadline exceeded")
+
+    async def _acquire(self, user_id: str, priority: int):
+        if self._active < self.max_concurrency and not self._queued:
+            self._active += 1
+            return
+        if self._queued >= self.max_queue:
+            self._counts["shed"] += 1
+            raise GenerationUnavailable("generation queue full")
+
+        fut = asyncio.get_running_loop().create_future()
+        user_round = self._waiting.get(user_id, 0)
+        entry = (priority, user_round, next(self._seq), user_id, fut)
+        heapq.heappush(self._heap, entry)
+        self._waiting[user_id] = user_round + 1
+        self._queued += 1
+        try:
+            await fut  # resolved by _release when a slot is handed over
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()  # slot was handed over just as we gave up
+            else:
+                fut.cancel()
+                self._dequeued(user_id)
+            raise
+
+    def _dequeued(self, user_id: str):
+        self._queued -= 1
+        self._waiting[user_id] -= 1
+        if not self._waiting[user_id]:
+            del self._waiting[user_id]
+
+    def _release(self):
+        while self._heap:
+            *_, user_id, fut = heapq.heappop(self._heap)
+            if fut.cancelled():
+                continue  # already dequeued when it was cancelled
+            self._dequeued(user_id)
+            fut.set_result(None)  # hand our slot straight to the next waiter
+            return
+        self._active -= 1
+
+    def stats(self) -> dict:
+        return {
+            **self._counts,
+            "active": self._active,
+            "queue_depth": self._queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "breaker_state": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+        }
+
+class FakeProvider:
+    """
+    Local stand-in for the HF provider, for tests and offline runs.
+    Sleeps `latency_s` and fails with probability `error_rate`.
     """
-    # return raw_block  # For now, just return the raw block
+
+    def __init__(self, latency_s: float = 0.05, error_rate: float = 0.0, seed: int = None):
+        self.latency_s = latency_s
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    async def __call__(self, user_id: str, raw_block: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency_s)
+        if self._rng.random() < self.error_rate:
+            raise RuntimeError("fake provider error")
+        return f"Journal entry for {user_id}:\n\n{raw_block}"
+
+async def _hf_generate(user_id: str, raw_block: str) -> str:
+    """Call the HF chat-completions endpoint in a worker thread."""
     messages = [
         {"role": "system", "content": "You are a warm, personal journalling assistant. \
          Below is a block of text that contains the user's answers to journalling prompts. \
          Generate a coherent journal entry based on this information, in no more than 300 words. Keep the tone light and breezy."},
         {"role": "user", "content": raw_block}
     ]
-    completion = client.chat.completions.create(
+    completion = await asyncio.to_thread(
+        client.chat.completions.create,
         model=BASE_MODEL,
         messages=messages,
         max_tokens=500
     )
     return completion.choices[0].message.content
 
+gateway = GenerationGateway(
+    provider=FakeProvider() if GEN_PROVIDER == "fake" else _hf_generate,
+    max_concurrency=GEN_MAX_CONCURRENCY,
+    max_queue=GEN_MAX_QUEUE,
+    deadline_s=GEN_DEADLINE_S,
+    breaker=CircuitBreaker(
+        window=GEN_BREAKER_WINDOW,
+        min_calls=GEN_BREAKER_MIN_CALLS,
+        error_rate=GEN_BREAKER_ERROR_RATE,
+        slow_s=GEN_BREAKER_SLOW_S,
+        cooldown_s=GEN_BREAKER_COOLDOWN_S,
+    ),
+)
+
+async def generate_entry(user_id: str, raw_block: str) -> str:
+    """
+    1. Determine Adapter Repo for User
+    2. Call HF Inference Endpoint through the generation gateway
+    3. Return generated text
+    Raises GenerationUnavailable when the gateway refuses or times out the request.
+    """
+    return await gateway.generate(user_id, raw_block)
+
 # def train_adapter(user_id: str, samples: list[str]) -> str:
 #     """
 #     1) Write `samples` to a temp file
@@ -6,11 +6,14 @@ from dotenv import load_dotenv # type: ignore
 
 load_dotenv()
 
-from app.routers import entry, flashback, finetune, stats  # type: ignore
+from app.routers import entry, flashback, finetune, stats, export, related, on_this_day  # type: ignore
 app = FastAPI(name="Memory Capsule API")
 
 app.include_router(entry.router, prefix="/entry", tags=["entry"])
 app.include_router(flashback.router, prefix="/flashback", tags=["flashback"])
 app.include_router(finetune.router, prefix="/tune", tags=["tune"])
 app.include_router(stats.router, prefix="/stats", tags=["stats"])
+app.include_router(export.router, prefix="/export", tags=["export"])
+app.include_router(related.router, prefix="/related", tags=["related"])
+app.include_router(on_this_day.router, prefix="/on-this-day", tags=["related"])
 
@@ -1,8 +1,10 @@
+import os
 from typing import Optional, List, Literal
-from fastapi import APIRouter, HTTPException # type: ignore
+from fastapi import APIRouter, HTTPException, Query # type: ignore
 from pydantic import BaseModel, model_validator # type: ignore
-from app.storage import save_entry  # type: ignore
-from app.hf_client import generate_entry # type: ignore
+from starlette.concurrency import run_in_threadpool # type: ignore
+from app.storage import save_entry, _entries_dir  # type: ignore
+from app.hf_client import generate_entry, gateway # type: ignore
 
 router = APIRouter()
 
@@ -32,12 +34,13 @@ class EntryResponse(BaseModel):
 
 @router.post("", response_model=EntryResponse)
 async def create_entry(req: EntryRequest):
+    # save_entry blocks (embedding calls, user lock), so it runs in the threadpool
     # Manual mode: save directly
     if req.mode == "manual":
         if not req.content or not req.content.strip():
             raise HTTPException(status_code=400, detail="Content cannot be empty.")
         entry_text = req.content.strip()
-        entry_id, text, *_ = save_entry(req.user_id, entry_text)
+        entry_id, text, *_ = await run_in_threadpool(save_entry, req.user_id, entry_text)
         return {"entry_id": entry_id, "text": entry_text}
     # AI mode: generate entry from answers
     if req.mode == "ai":
@@ -47,9 +50,38 @@ async def create_entry(req: EntryRequest):
 
         try:
             ai_text = await generate_entry(req.user_id, raw_block)
-        except Exception:
+        except Exception:  # provider error, or the gateway shed / timed out / failed fast
             ai_text = raw_block
-        entry_id, text, *_ = save_entry(req.user_id, ai_text)
+        entry_id, text, *_ = await run_in_threadpool(save_entry, req.user_id, ai_text)
         return {"entry_id": entry_id, "text": text}
 
-    raise HTTPException(status_code=400, detail="Invalid mode. Use 'manual' or 'ai'.")
\ No newline at end of file
+    raise HTTPException(status_code=400, detail="Invalid mode. Use 'manual' or 'ai'.")
+
+@router.get("/generation/stats", response_model=dict)
+def generation_stats():
+    """
+    Returns this worker's generation gateway state: active calls, queue depth,
+    shed / timed-out / failed counts and circuit breaker state.
+    """
+    return gateway.stats()
+
+@router.get("/{user_id}", response_model=dict)
+def list_entries(
+    user_id: str,
+    offset: int = Query(0, ge=0, description="Number of newest entries to skip"),
+    limit: int = Query(10, ge=1, le=50, description="Page size"),
+):
+    """
+    Returns one page of the user's entries, newest first, plus the total count.
+    Only the requested page is read from disk.
+    """
+    ed = _entries_dir(user_id)
+    if not os.path.exists(ed):
+        return {"total": 0, "offset": offset, "entries": []}
+    entry_ids = sorted((fn.rsplit(".", 1)[0] for fn in os.listdir(ed) if fn.endswith(".txt")), reverse=True)
+
+    entries = []
+    for entry_id in entry_ids[offset:offset + limit]:
+        with open(os.path.join(ed, f"{entry_id}.txt"), "r") as f:
+            entries.append({"entry_id": entry_id, "content": f.read()})
+    return {"total": len(entry_ids), "offset": offset, "entries": entries}
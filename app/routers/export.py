@@ -0,0 +1,48 @@
+import tarfile
+import tempfile
+from fastapi import APIRouter, HTTPException, Request # type: ignore
+from fastapi.responses import StreamingResponse # type: ignore
+from starlette.concurrency import run_in_threadpool # type: ignore
+
+from app.backup import CHUNK_SIZE, export_capsule, restore_capsule
+
+router = APIRouter()
+
+@router.get(
+    "/{user_id}",
+    summary="Stream a point-in-time tar snapshot of a user's capsule",
+)
+def export(user_id: str):
+    """
+    Snapshots entries, index, id map and meta consistently, then streams
+    them as an uncompressed tar archive in fixed-size chunks.
+    """
+    try:
+        stream = export_capsule(user_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="No entries found for this user")
+    return StreamingResponse(
+        stream,
+        media_type="application/x-tar",
+        headers={"Content-Disposition": f'attachment; filename="{user_id}.tar"'},
+    )
+
+@router.post(
+    "/{user_id}/restore",
+    summary="Replace a user's capsule with an exported tar archive",
+)
+async def restore(user_id: str, request: Request):
+    """
+    Accepts a tar archive from `GET /export/{user_id}` as the raw request body.
+    The upload is spooled to disk, validated and swapped in atomically;
+    the FAISS index is loaded as-is, without re-embedding.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE) as f:
+        async for chunk in request.stream():
+            f.write(chunk)
+        f.seek(0)
+        try:
+            await run_in_threadpool(restore_capsule, user_id, f)
+        except (ValueError, EOFError, tarfile.TarError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+    return {"user_id": user_id, "status": "restored"}
@@ -1,19 +1,62 @@
 import os
 import json
 from fastapi import APIRouter, HTTPException, Query # type: ignore
+from pydantic import BaseModel, Field # type: ignore
 from typing import List
 import numpy as np
 import faiss # type: ignore
 
 from app.storage import (
     _embed_text,
+    _embed_texts,
     _index_path,
     _id_map_path,
     _entries_dir,
+    _load_passages,
+    _search_entries,
+    get_index_version,
+    EmbeddingUnavailable,
 )
+from app.cache import flashback_cache # type: ignore
 
 router = APIRouter()
 
+class FlashbackBatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=50)
+    k: int = Field(5, ge=1, le=20)
+
+def _load_user_index(user_id: str):
+    """
+    Load a user's FAISS index with its ID and passage maps.
+    Raises 404 if the user has no index yet.
+    """
+    index_file = _index_path(user_id)
+    id_map_file = _id_map_path(user_id)
+    if not os.path.exists(index_file) or not os.path.exists(id_map_file):
+        raise HTTPException(status_code=404, detail="No entries found for this user")
+    with open(id_map_file, "r") as f:
+        id_map = json.load(f)
+    return faiss.read_index(index_file), id_map, _load_passages(user_id)
+
+def _read_entry(user_id: str, entry_id: str) -> str:
+    path = os.path.join(_entries_dir(user_id), f"{entry_id}.txt")
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+def _passage_result(entry_id: str, dist: float, span, content: str) -> dict:
+    """Describe one hit by its best passage's offsets and text."""
+    start, end = span if span else (0, len(content))
+    return {
+        "entry_id":      entry_id,
+        "score":         dist,
+        "passage_start": start,
+        "passage_end":   end,
+        "snippet":       content[start:end],
+    }
+
 @router.get(
     "/{user_id}",
     response_model=List[dict],
@@ -24,10 +67,14 @@ def flashback(
     user_id: str,
     q: str = Query(..., description="Flashback query string"),
     k: int = Query(5, ge=1, le=20, description="Number of results to return"),
+    full: bool = Query(True, description="Include the full entry text in each result"),
 ):
     """
-    Returns up to k of the user’s past entries whose embeddings are closest
-    to the query string `q`.
+    Returns up to k of the user’s past entries whose passages are closest
+    to the query string `q`, each with the offsets and text of its best
+    matching passage.
+    Results are cached per (user, normalized query, k, full, index version),
+    and concurrent identical requests share one computation.
     """
     # ed = _entries_dir(user_id)
     # if not os.path.exists(ed):
@@ -40,38 +87,70 @@ def flashback(
     #         content = f.read()
     #     entry_id = fn.rsplit(".", 1)[0]  # Extract entry ID from filename
     #     results.append({"entry_id": entry_id, "content": content})
-    index_file = _index_path(user_id)
-    id_map_file = _id_map_path(user_id)
-    entries_dir = _entries_dir(user_id)
+    q = " ".join(q.lower().split())  # MiniLM is uncased, so this doesn't change the embedding
+    key = (user_id, q, k, full, get_index_version(user_id))
+    return flashback_cache.get_or_compute(key, lambda: _flashback(user_id, q, k, full))
 
-    if not os.path.exists(index_file) or not os.path.exists(id_map_file):
-        raise HTTPException(status_code=404, detail="No entries found for this user")
-    
-    # Load FAISS mapping
-    with open(id_map_file, "r") as f:
-        id_map = json.load(f)
-    
-    # Load FAISS index
-    index = faiss.read_index(index_file)
+def _flashback(user_id: str, q: str, k: int, full: bool) -> list:
+    index, id_map, passages = _load_user_index(user_id)
 
-    # Embed the query
-    emb = _embed_text(q).astype("float32")
-    D, I = index.search(np.array([emb]), k)
+    # Embed the query; a failure must raise (503), not search with a zero
+    # vector whose results would then be cached as real flashbacks
+    try:
+        emb = np.asarray(_embed_text(q, fallback=False), dtype="float32")
+    except EmbeddingUnavailable:
+        raise HTTPException(status_code=503, detail="Embedding service unavailable, try again")
+    hits = _search_entries(index, emb, k, id_map, passages)[0]
 
     # Retrieve the actual entries
     results = []
-    for dist, idx in zip(D[0], I[0]):
-        entry_id = id_map.get(str(int(idx)))
-        if not entry_id:
-            continue
-        path = os.path.join(entries_dir, f"{entry_id}.txt")
-        try:
-            content = open(path, "r").read()
-        except FileNotFoundError:
-            content = ""
-        results.append({
-            "entry_id": entry_id,
-            "content":  content,
-            "score":    float(dist)
-        })
-    return results
\ No newline at end of file
+    for entry_id, dist, span in hits:
+        content = _read_entry(user_id, entry_id)
+        result = _passage_result(entry_id, dist, span, content)
+        if full:
+            result["content"] = content
+        results.append(result)
+    return results
+
+@router.get(
+    "/cache/stats",
+    response_model=dict,
+    summary="Flashback result cache statistics",
+)
+def cache_stats():
+    """
+    Returns hits, misses, coalesced waits, evictions and current size of
+    this worker's flashback cache.
+    """
+    return flashback_cache.stats()
+
+@router.post(
+    "/{user_id}/batch",
+    response_model=dict,
+    summary="Run several flashback queries in one request",
+)
+def flashback_batch(user_id: str, req: FlashbackBatchRequest):
+    """
+    Embeds all queries in one batch and runs a single matrix search.
+    Returns per-query hits (without full text) in request order, plus each
+    matched entry's content once under `entries`.
+    """
+    index, id_map, passages = _load_user_index(user_id)
+
+    unique_queries = list(dict.fromkeys(req.queries))
+    try:
+        embs = _embed_texts(unique_queries, fallback=False)
+    except EmbeddingUnavailable:
+        raise HTTPException(status_code=503, detail="Embedding service unavailable, try again")
+    hits_by_query = dict(zip(unique_queries, _search_entries(index, embs, req.k, id_map, passages)))
+
+    entries = {}
+    results = []
+    for q in req.queries:
+        hits = []
+        for entry_id, dist, span in hits_by_query[q]:
+            if entry_id not in entries:
+                entries[entry_id] = _read_entry(user_id, entry_id)
+            hits.append(_passage_result(entry_id, dist, span, entries[entry_id]))
+        results.append({"q": q, "results": hits})
+    return {"results": results, "entries": entries}
@@ -0,0 +1,48 @@
+import os
+from datetime import date as date_cls, datetime
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query # type: ignore
+
+from app.storage import _entries_dir, _load_date_index
+
+router = APIRouter()
+
+@router.get(
+    "/{user_id}",
+    response_model=List[dict],
+    summary="Get entries written on this day in earlier years",
+)
+def on_this_day(
+    user_id: str,
+    date: Optional[str] = Query(None, description="Day to look back from (YYYY-MM-DD), defaults to today (UTC)"),
+    full: bool = Query(True, description="Include the full entry text in each result"),
+):
+    """
+    Returns the user's entries from the same month and day in earlier years,
+    most recent first, using the date index (no embedding or index search).
+    """
+    try:
+        day = date_cls.fromisoformat(date) if date else datetime.utcnow().date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
+
+    entry_ids = _load_date_index(user_id).get(day.strftime("%m-%d"), [])
+    results = []
+    for entry_id in sorted(entry_ids, reverse=True):
+        year = int(entry_id[:4])
+        if year >= day.year:
+            continue
+        result = {
+            "entry_id":  entry_id,
+            "date":      f"{entry_id[:4]}-{entry_id[4:6]}-{entry_id[6:8]}",
+            "years_ago": day.year - year,
+        }
+        if full:
+            path = os.path.join(_entries_dir(user_id), f"{entry_id}.txt")
+            try:
+                with open(path, "r") as f:
+                    result["content"] = f.read()
+            except FileNotFoundError:
+                result["content"] = ""
+        results.append(result)
+    return results
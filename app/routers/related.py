@@ -0,0 +1,57 @@
+import os
+from typing import List
+from fastapi import APIRouter, HTTPException, Query # type: ignore
+
+from app.storage import (
+    RELATED_K,
+    _entries_dir,
+    _index_path,
+    _load_graph,
+    _graph_row,
+)
+
+router = APIRouter()
+
+@router.get(
+    "/{user_id}/{entry_id}",
+    response_model=List[dict],
+    summary="Get entries similar to a given entry",
+)
+def related(
+    user_id: str,
+    entry_id: str,
+    k: int = Query(5, ge=1, le=RELATED_K, description="Number of related entries to return"),
+    full: bool = Query(True, description="Include the full entry text in each result"),
+):
+    """
+    Returns up to k entries nearest to `entry_id`, read from the precomputed
+    related-entries graph (no embedding, index search or writes). Capsules
+    that predate the graph get a 404 until their next save builds it.
+    """
+    graph = _load_graph(user_id, mmap=True)
+    if graph is None:
+        if not os.path.exists(_index_path(user_id)):
+            raise HTTPException(status_code=404, detail="No entries found for this user")
+        # Capsule from before the graph existed: save_entry builds it on the next save
+        raise HTTPException(status_code=404, detail="Related entries not built yet for this user")
+
+    row = _graph_row(graph, entry_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    record = graph[row]
+
+    results = []
+    for nbr, dist in zip(record["neighbors"][:k], record["dist"][:k]):
+        if nbr < 0:
+            break  # fewer than k neighbours
+        nbr_id = graph[nbr]["entry_id"].decode()
+        result = {"entry_id": nbr_id, "score": float(dist)}
+        if full:
+            path = os.path.join(_entries_dir(user_id), f"{nbr_id}.txt")
+            try:
+                with open(path, "r") as f:
+                    result["content"] = f.read()
+            except FileNotFoundError:
+                result["content"] = ""
+        results.append(result)
+    return results
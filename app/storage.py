@@ -1,5 +1,9 @@
 import os
+import re
 import json
+import time
+import fcntl
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 import faiss # type: ignore
@@ -12,10 +16,32 @@ DATA_DIR = os.getenv("DATA_DIR", "./data")
 # HF Token and Model
 HF_TOKEN = os.getenv("HF_TOKEN")
 EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_DIM = int(os.getenv("EMBED_DIM", 384))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+
+# Passage chunking (MiniLM truncates at 256 word-pieces, ~128 words is safe)
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", 128))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 32))
 
 # Inference API
 embed_api = InferenceClient(model=EMBED_MODEL, token=HF_TOKEN)
 
+# Vector encoding for per-user indexes: "flat" (float32), "fp16" or "int8"
+# (scalar quantization), or "pq" (product quantization, for large users)
+INDEX_ENCODING = os.getenv("INDEX_ENCODING", "flat")
+PQ_M = int(os.getenv("PQ_M", 48))  # PQ sub-quantizers (bytes per vector), must divide the dim
+
+# Trained encodings need enough vectors to fit; smaller indexes stay flat until then
+_ENCODING_MIN_VECTORS = {
+    "flat": 0,
+    "fp16": 0,
+    "int8": int(os.getenv("INT8_MIN_VECTORS", 256)),
+    "pq": int(os.getenv("PQ_MIN_VECTORS", 39 * 256)),  # faiss' minimum for 256 centroids per sub-quantizer
+}
+
+# Neighbours kept per entry in the related-entries graph
+RELATED_K = int(os.getenv("RELATED_K", 8))
+
 # Milestones for badges
 _BADGE_MILESTONES = {
     3: "3-day streak",
@@ -43,29 +69,79 @@ def _index_path(user_id: str) -> str:
 def _id_map_path(user_id: str) -> str:
     return os.path.join(_index_dir(user_id), "id_map.json")
 
+def _passages_path(user_id: str) -> str:
+    return os.path.join(_index_dir(user_id), "passages.json")
+
+def _graph_path(user_id: str) -> str:
+    return os.path.join(_index_dir(user_id), "related.npy")
+
+def _dates_path(user_id: str) -> str:
+    return os.path.join(_index_dir(user_id), "dates.json")
+
+def _lock_path(user_id: str) -> str:
+    # Kept outside the user directory so it survives the directory being swapped on restore
+    return os.path.join(DATA_DIR, ".locks", f"{user_id}.lock")
+
+# Atomic writes
+def _write_json_atomic(path: str, data, indent=None):
+    """
+    Write JSON to a temp file and rename it over `path`, so readers that
+    don't take the user lock (flashback, on-this-day) never see a torn file.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp, path)
+
 # Directory creating
 def _ensure_user_dirs(user_id: str):
     os.makedirs(_entries_dir(user_id), exist_ok=True)
     os.makedirs(_index_dir(user_id), exist_ok=True)
 
+# Locking
+@contextmanager
+def _user_lock(user_id: str, shared: bool = False):
+    """
+    Cross-process lock on a user's capsule. Writers hold it exclusively;
+    snapshots hold it shared so they see index, id map and meta in step.
+    """
+    path = _lock_path(user_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
 # Metadata management
 def load_meta(user_id: str) -> dict:
     path = _meta_path(user_id)
     if os.path.exists(path):
         with open(path, 'r') as f:
             return json.load(f)
-    return {"entries": [], "streak": 0, "badges": []}
+    return {"entries": [], "streak": 0, "badges": [], "version": 0}
 
 def save_meta(user_id: str, meta: dict):
-    with open(_meta_path(user_id), 'w') as f:
+    # Write then rename, so concurrent readers (e.g. flashback's version check)
+    # never see a half-written file
+    tmp = _meta_path(user_id) + ".tmp"
+    with open(tmp, 'w') as f:
         json.dump(meta, f, indent=2)
+    os.replace(tmp, _meta_path(user_id))
+
+def get_index_version(user_id: str) -> int:
+    """Counter bumped on every indexed write; lets caches key results by index state."""
+    return load_meta(user_id).get("version", 0)
 
 def _update_meta(user_id: str, entry_date: str):
     """
-    Add a new entry date (ISO 'YYYY-MM-DD') and compute streak + badge.
+    Add a new entry date (ISO 'YYYY-MM-DD'), compute streak + badge and
+    bump the index version, in a single meta write.
     Returns: (streak, badge_awarded or None)
     """
     meta = load_meta(user_id)
+    meta["version"] = meta.get("version", 0) + 1  # invalidates cached flashback results
 
     # Add unique, sorted
     if entry_date not in meta["entries"]:
@@ -92,12 +168,66 @@ def _update_meta(user_id: str, entry_date: str):
     return streak, badge
 
 # Faiss index management
+def _index_encoding(index: faiss.Index) -> str:
+    """Name the vector encoding of `index` as used by INDEX_ENCODING."""
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return {
+            faiss.ScalarQuantizer.QT_fp16: "fp16",
+            faiss.ScalarQuantizer.QT_8bit: "int8",
+        }.get(index.sq.qtype, "sq")
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    return "flat"
+
+def _target_encoding(ntotal: int) -> str:
+    """The configured encoding, or "flat" while there are too few vectors to train it."""
+    if ntotal < _ENCODING_MIN_VECTORS.get(INDEX_ENCODING, 0):
+        return "flat"
+    return INDEX_ENCODING
+
+def _build_index(vectors: np.ndarray, encoding: str) -> faiss.Index:
+    """
+    Build an L2 index with the given encoding, training it on `vectors`
+    if needed, and add `vectors` to it.
+    """
+    dim = vectors.shape[1]
+    if encoding == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif encoding == "fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    elif encoding == "int8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    elif encoding == "pq":
+        index = faiss.IndexPQ(dim, PQ_M, 8)
+    else:
+        raise ValueError(f"Unknown index encoding: {encoding!r}")
+
+    if not index.is_trained and len(vectors):
+        index.train(vectors)
+    if len(vectors):
+        index.add(vectors)
+    return index
+
+def _maybe_migrate_index(index: faiss.Index) -> faiss.Index:
+    """
+    Re-encode `index` if its encoding differs from the one configured for its size.
+    Vectors are decoded from the current encoding, so migrating away from a
+    quantized encoding cannot recover the lost precision.
+    Runs inside save_entry under the user lock, so the save that crosses a
+    threshold stalls while the encoding trains (seconds for PQ at ~10k vectors).
+    """
+    target = _target_encoding(index.ntotal)
+    if _index_encoding(index) == target:
+        return index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    return _build_index(vectors, target)
+
 def _load_or_create_index(user_id: str, dim: int) -> faiss.Index:
-    """Load existing FAISS index or return a new FlatL2 index of dimension `dim`."""
+    """Load existing FAISS index or return a new empty index of dimension `dim`."""
     path = _index_path(user_id)
     if os.path.exists(path):
         return faiss.read_index(path)
-    return faiss.IndexFlatL2(dim)
+    return _build_index(np.empty((0, dim), dtype="float32"), _target_encoding(0))
 
 def _save_index(user_id: str, index: faiss.Index):
     faiss.write_index(index, _index_path(user_id))
@@ -112,20 +242,249 @@ def _load_id_map(user_id: str, index: faiss.Index):
 
 def _save_id_map(user_id: str, id_map: dict):
     """Save mapping of FAISS internal IDs to entry_id strings."""
-    with open(_id_map_path(user_id), "w") as f:
-        json.dump(id_map, f, indent=2)
+    _write_json_atomic(_id_map_path(user_id), id_map, indent=2)
+
+def _load_passages(user_id: str) -> dict:
+    """
+    Map FAISS internal IDs to [start, end] character offsets of the passage
+    within its entry. IDs missing here (pre-chunking entries) cover the whole entry.
+    """
+    path = _passages_path(user_id)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+def _save_passages(user_id: str, passages: dict):
+    """Save mapping of FAISS internal IDs to passage offsets."""
+    _write_json_atomic(_passages_path(user_id), passages)
+
+# Passage chunking
+def _chunk_text(text: str) -> list:
+    """
+    Split `text` into overlapping windows of CHUNK_WORDS words, stepping
+    CHUNK_WORDS - CHUNK_OVERLAP words at a time.
+    Returns: list of (start, end) character offsets into `text`.
+    """
+    words = [m.span() for m in re.finditer(r"\S+", text)]
+    if not words:
+        return [(0, len(text))]
+
+    step = max(1, CHUNK_WORDS - CHUNK_OVERLAP)
+    spans = []
+    for first in range(0, len(words), step):
+        last = min(first + CHUNK_WORDS, len(words)) - 1
+        spans.append((words[first][0], words[last][1]))
+        if last == len(words) - 1:
+            break
+    return spans
 
 # Embedding management
-def _embed_text(text: str) -> np.ndarray:
+class EmbeddingUnavailable(Exception):
+    """Raised by the embed helpers when the HF call fails and `fallback` is off."""
+
+def _embed_text(text: str, fallback: bool = True) -> np.ndarray:
     """
     Call HF InferenceApi to get a 1D float32 embedding for `text`.
+    On failure returns a zero vector, or raises EmbeddingUnavailable if not `fallback`.
     """
     try:
         result = embed_api.feature_extraction(text=text)
-    except Exception:
-        result = np.zeros(384, dtype="float32")  # Fallback to zero vector if embedding fails
+    except Exception as e:
+        if not fallback:
+            raise EmbeddingUnavailable(str(e)) from e
+        result = np.zeros(EMBED_DIM, dtype="float32")  # Fallback to zero vector if embedding fails
     return result
 
+def _embed_texts(texts: list, fallback: bool = True) -> np.ndarray:
+    """
+    Embed `texts` with one HF call per EMBED_BATCH_SIZE inputs.
+    Returns a 2D float32 array of shape (len(texts), dim).
+    On failure uses zero vectors, or raises EmbeddingUnavailable if not `fallback`.
+    """
+    batches = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        batch = texts[start:start + EMBED_BATCH_SIZE]
+        try:
+            result = embed_api.feature_extraction(text=batch)
+            result = np.asarray(result, dtype="float32").reshape(len(batch), -1)
+        except Exception as e:
+            if not fallback:
+                raise EmbeddingUnavailable(str(e)) from e
+            result = np.zeros((len(batch), EMBED_DIM), dtype="float32")  # Fallback to zero vectors
+        batches.append(result)
+    return np.vstack(batches)
+
+# Passage search
+def _search_entries(index: faiss.Index, queries: np.ndarray, k: int, id_map: dict, passages: dict) -> list:
+    """
+    Search passages for every row of `queries` in one matrix search and
+    aggregate hits per entry, keeping each entry's closest passage (max-sim).
+    Widens the search until every query has k distinct entries or the index
+    is exhausted.
+    Returns: one list per query of up to k (entry_id, distance, span) tuples,
+        closest first. `span` is [start, end] or None for entries indexed before chunking.
+    """
+    queries = np.asarray(queries, dtype="float32").reshape(-1, index.d)
+    fetch = min(index.ntotal, k * 4)
+    while True:
+        D, I = index.search(queries, fetch)
+        results = []
+        for dists, idxs in zip(D, I):
+            best = {}
+            for dist, idx in zip(dists, idxs):
+                entry_id = id_map.get(str(int(idx)))
+                if not entry_id or entry_id in best:
+                    continue  # hits are sorted, so the first one per entry is the best
+                best[entry_id] = (entry_id, float(dist), passages.get(str(int(idx))))
+            results.append(list(best.values())[:k])
+        if fetch >= index.ntotal or all(len(hits) >= k for hits in results):
+            return results
+        fetch = min(index.ntotal, fetch * 2)
+
+# Related-entries graph
+# One record per entry, sorted by entry_id (i.e. by creation time):
+#   entry_id, neighbors (row numbers, -1 padded), dist (L2, inf padded, ascending)
+def _graph_dtype(k: int) -> np.dtype:
+    return np.dtype([("entry_id", "S32"), ("neighbors", "i4", (k,)), ("dist", "f4", (k,))])
+
+def _load_graph(user_id: str, mmap: bool = False):
+    """Load the user's related-entries graph (memory-mapped read-only if `mmap`), or None."""
+    path = _graph_path(user_id)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+def _save_graph(user_id: str, graph: np.ndarray):
+    # Write then rename, so readers never map a half-written file
+    tmp = _graph_path(user_id) + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, graph)
+    os.replace(tmp, _graph_path(user_id))
+
+def _graph_row(graph: np.ndarray, entry_id: str):
+    """Row number of `entry_id` in `graph`, or None."""
+    key = entry_id.encode()
+    ids = graph["entry_id"]
+    row = int(np.searchsorted(ids, key))
+    if row < len(graph) and ids[row] == key:
+        return row
+    rows = np.flatnonzero(ids == key)  # rows appended out of order (e.g. clock skew)
+    return int(rows[0]) if len(rows) else None
+
+def _nearest_entries(hit_lists: list, k: int, exclude: str) -> list:
+    """
+    Merge per-passage search hits into an entry's k nearest other entries.
+    Returns: [(entry_id, distance)] closest first.
+    """
+    best = {}
+    for hits in hit_lists:
+        for entry_id, dist, _ in hits:
+            if entry_id != exclude and dist < best.get(entry_id, np.inf):
+                best[entry_id] = dist
+    return sorted(best.items(), key=lambda item: item[1])[:k]
+
+def _build_related_graph(index: faiss.Index, id_map: dict) -> np.ndarray:
+    """Build the whole graph from the vectors already in `index`, with one matrix search."""
+    vector_ids = sorted(int(idx) for idx in id_map)
+    hit_lists = _search_entries(index, index.reconstruct_batch(vector_ids), RELATED_K + 1, id_map, {})
+    hits_by_entry = {}
+    for idx, hits in zip(vector_ids, hit_lists):
+        hits_by_entry.setdefault(id_map[str(idx)], []).append(hits)
+
+    entry_ids = sorted(hits_by_entry)
+    row_of = {entry_id: row for row, entry_id in enumerate(entry_ids)}
+    graph = np.zeros(len(entry_ids), dtype=_graph_dtype(RELATED_K))
+    graph["entry_id"] = entry_ids
+    graph["neighbors"] = -1
+    graph["dist"] = np.inf
+    for row, entry_id in enumerate(entry_ids):
+        for rank, (nbr_id, dist) in enumerate(_nearest_entries(hits_by_entry[entry_id], RELATED_K, entry_id)):
+            graph["neighbors"][row, rank] = row_of[nbr_id]
+            graph["dist"][row, rank] = dist
+    return graph
+
+def _update_related_graph(user_id: str, index: faiss.Index, id_map: dict, entry_id: str, embeddings: np.ndarray):
+    """
+    Add `entry_id` (already in `index`) to the graph: record its nearest
+    entries and offer it as a neighbour to every entry it is closer to than
+    that entry's current farthest neighbour.
+    Users without a graph yet get one built from their whole index.
+    """
+    graph = _load_graph(user_id)
+    if graph is None:
+        _save_graph(user_id, _build_related_graph(index, id_map))
+        return
+
+    k = graph.dtype["neighbors"].shape[0]
+    record = np.zeros(1, dtype=graph.dtype)
+    record["entry_id"] = entry_id
+    record["neighbors"] = -1
+    record["dist"] = np.inf
+    graph = np.concatenate([graph, record])
+    new_row = len(graph) - 1
+
+    # Distances to every other entry: k-NN isn't symmetric, so the new entry
+    # must be offered to any entry whose farthest neighbour it beats, not
+    # just to its own k nearest
+    row_of = {eid.decode(): row for row, eid in enumerate(graph["entry_id"])}
+    distances = _nearest_entries(_search_entries(index, embeddings, len(graph), id_map, {}), len(graph), entry_id)
+    rank = 0
+    for nbr_id, dist in distances:
+        nbr = row_of.get(nbr_id)
+        if nbr is None:
+            continue
+        if rank < k:
+            graph["neighbors"][new_row, rank] = nbr
+            graph["dist"][new_row, rank] = dist
+            rank += 1
+
+        # Reciprocal update: replace the neighbour's farthest slot if we're closer
+        nbr_dist = graph["dist"][nbr]
+        if dist < nbr_dist[-1]:
+            slot = int(np.searchsorted(nbr_dist, dist, side="right"))
+            graph["neighbors"][nbr, slot + 1:] = graph["neighbors"][nbr, slot:-1].copy()
+            graph["dist"][nbr, slot + 1:] = nbr_dist[slot:-1].copy()
+            graph["neighbors"][nbr, slot] = new_row
+            graph["dist"][nbr, slot] = dist
+    _save_graph(user_id, graph)
+
+def rebuild_related_graph(user_id: str):
+    """
+    (Re)build a user's related-entries graph from their index; no embedding calls.
+    For offline use: searches the whole index under the exclusive user lock.
+    save_entry builds a missing graph on its own.
+    """
+    with _user_lock(user_id):
+        index = faiss.read_index(_index_path(user_id))
+        _save_graph(user_id, _build_related_graph(index, _load_id_map(user_id, index)))
+
+# Date index
+def _load_date_index(user_id: str) -> dict:
+    """
+    Map 'MM-DD' to the entry_ids written on that day of any year.
+    Built from the entry files for capsules that predate the index.
+    """
+    path = _dates_path(user_id)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    dates = {}
+    ed = _entries_dir(user_id)
+    if os.path.exists(ed):
+        for fn in sorted(os.listdir(ed)):
+            if fn.endswith(".txt"):
+                entry_id = fn.rsplit(".", 1)[0]
+                dates.setdefault(f"{entry_id[4:6]}-{entry_id[6:8]}", []).append(entry_id)
+    return dates
+
+def _update_date_index(user_id: str, entry_id: str):
+    dates = _load_date_index(user_id)
+    day = dates.setdefault(f"{entry_id[4:6]}-{entry_id[6:8]}", [])
+    if entry_id not in day:
+        day.append(entry_id)
+    _write_json_atomic(_dates_path(user_id), dates)  # /on-this-day reads without the lock
+
 # Entry ID Generation
 def _generate_entry_id() -> str:
     """
@@ -137,38 +496,58 @@ def _generate_entry_id() -> str:
 # Public Save Function
 def save_entry(user_id: str, content: str):
     """
-    1) Ensure directories exist
-    2) Write `content` to a new .txt file named by entry_id
-    3) Update streak & badges based on entry date
-    4) Embed + add to FAISS index + update ID map
+    1) Chunk into passages and embed them in batches
+    2) Under the user lock: ensure directories exist and write `content`
+       to a new .txt file named by entry_id
+    3) Add passage vectors to FAISS index + update ID/passage maps
+    4) Update the related-entries graph and the date index
+    5) Update streak & badges based on entry date and bump the index version
     Returns:
       entry_id (str), content (str), streak (int), badge_awarded (str|None)
     """
-    # Ensure user directories exist
-    _ensure_user_dirs(user_id)
+    # Embed passages first so the user lock isn't held across HF calls
+    spans = _chunk_text(content)
+    embeddings = _embed_texts([content[start:end] for start, end in spans]) # 2D (n_passages, dim)
 
-    # Write file
-    entry_id = _generate_entry_id()
-    file_path = os.path.join(_entries_dir(user_id), f"{entry_id}.txt")
-    with open(file_path, 'w') as f:
-        f.write(content)
-    
-    # Update metadata
-    date_iso = entry_id[:8]  # Extract date from ID
-    date_iso = f"{date_iso[:4]}-{date_iso[4:6]}-{date_iso[6:]}"  # Convert to YYYY-MM-DD
-    streak, badge = _update_meta(user_id, date_iso)
-
-    # RAG indexing
-    embedding = _embed_text(content) # 1D (dim,)
-    dim = embedding.shape[0]
-    index = _load_or_create_index(user_id, dim)
-    id_map = _load_id_map(user_id, index)
-
-    new_idx = index.ntotal 
-    index.add(embedding.reshape(1, dim)) # add new vector
-    id_map[str(new_idx)] = entry_id  # Map FAISS ID to our entry_id
-
-    _save_index(user_id, index)
-    _save_id_map(user_id, id_map)
+    with _user_lock(user_id):
+        # Ensure user directories exist
+        _ensure_user_dirs(user_id)
+
+        # Write file. IDs have one-second resolution, so create exclusively and
+        # wait for the next ID on a clash: entries are never overwritten, which
+        # also keeps them safe to hard-link into export snapshots
+        while True:
+            entry_id = _generate_entry_id()
+            file_path = os.path.join(_entries_dir(user_id), f"{entry_id}.txt")
+            try:
+                with open(file_path, 'x') as f:
+                    f.write(content)
+                break
+            except FileExistsError:
+                time.sleep(0.05)
+
+        # RAG indexing
+        dim = embeddings.shape[1]
+        index = _load_or_create_index(user_id, dim)
+        id_map = _load_id_map(user_id, index)
+        passages = _load_passages(user_id)
+
+        first_idx = index.ntotal
+        index.add(embeddings) # add one vector per passage
+        for offset, (start, end) in enumerate(spans):
+            id_map[str(first_idx + offset)] = entry_id  # Map FAISS ID to our entry_id
+            passages[str(first_idx + offset)] = [start, end]
+        index = _maybe_migrate_index(index) # re-encode once INDEX_ENCODING changes or the index grows enough
+
+        _save_index(user_id, index)
+        _save_id_map(user_id, id_map)
+        _save_passages(user_id, passages)
+        _update_related_graph(user_id, index, id_map, entry_id, embeddings)
+        _update_date_index(user_id, entry_id)
+
+        # Update metadata last, so the version bump follows the index it describes
+        date_iso = entry_id[:8]  # Extract date from ID
+        date_iso = f"{date_iso[:4]}-{date_iso[4:6]}-{date_iso[6:]}"  # Convert to YYYY-MM-DD
+        streak, badge = _update_meta(user_id, date_iso)
 
     return entry_id, content, streak, badge
@@ -0,0 +1,78 @@
+"""
+Compare INDEX_ENCODING options against the float32 baseline.
+
+For each encoding, reports index size (bytes per vector and total),
+search latency and recall@k against exact IndexFlatL2 results.
+Recall is per stored vector (i.e. per passage), not per entry: flashback
+folds passages into entries, which usually hides some passage-level misses.
+
+Usage (from the repo root):
+    python -m benchmarks.index_encoding                      # synthetic vectors
+    python -m benchmarks.index_encoding --user-id testuser   # a real user's index
+"""
+import time
+import argparse
+
+import faiss # type: ignore
+import numpy as np
+
+from app.storage import _build_index, _index_path
+
+ENCODINGS = ["flat", "fp16", "int8", "pq"]
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Unit-norm vectors around a few hundred topics, roughly like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((256, dim)).astype("float32")
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.standard_normal((n, dim)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def user_vectors(user_id: str) -> np.ndarray:
+    index = faiss.read_index(_index_path(user_id))
+    return index.reconstruct_n(0, index.ntotal)
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", help="Benchmark this user's stored vectors instead of synthetic ones")
+    parser.add_argument("--n", type=int, default=20000, help="Number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Number of query vectors")
+    parser.add_argument("--k", type=int, default=10, help="k for recall@k")
+    args = parser.parse_args()
+
+    if args.user_id:
+        vectors = user_vectors(args.user_id)
+    else:
+        vectors = synthetic_vectors(args.n, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+    k = min(args.k, len(vectors))
+
+    _, truth = _build_index(vectors, "flat").search(queries, k)
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {len(queries)} queries, k={k}")
+    print("recall@k is per vector (passage), not per entry\n")
+    print(f"{'encoding':<10}{'bytes/vec':>10}{'total MB':>10}{'build s':>10}{'ms/query':>10}{'recall@k':>10}")
+    for encoding in ENCODINGS:
+        start = time.perf_counter()
+        try:
+            index = _build_index(vectors, encoding)
+        except RuntimeError as e:  # e.g. too few vectors to train PQ
+            print(f"{encoding:<10}skipped: {str(e).splitlines()[0]}")
+            continue
+        build_s = time.perf_counter() - start
+
+        size = len(faiss.serialize_index(index))
+        start = time.perf_counter()
+        _, found = index.search(queries, k)
+        query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        print(f"{encoding:<10}{size / len(vectors):>10.0f}{size / 2**20:>10.2f}"
+              f"{build_s:>10.2f}{query_ms:>10.3f}{recall_at_k(truth, found):>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st # type: ignore
 import requests # type: ignore
+from requests.adapters import HTTPAdapter # type: ignore
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx # type: ignore
 from dotenv import load_dotenv # type: ignore
 
 # -- Configurations --
 load_dotenv()
 API_URL = os.getenv("API_URL", "http://127.0.0.1:8000")
+ENTRIES_PAGE_SIZE = 5
 
 QUESTIONS = [
     "How am I feeling right now?",
@@ -20,6 +25,62 @@ QUESTIONS = [
     "What’s one intention or hope I have for tomorrow?"
 ]
 
+# -- API access --
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One pooled, keep-alive HTTP session shared by every rerun and browser session."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_stats(user_id: str) -> dict:
+    r = get_session().get(f"{API_URL}/stats/{user_id}", timeout=5)
+    r.raise_for_status()
+    return r.json()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_flashback(user_id: str, q: str, k: int) -> list:
+    r = get_session().get(f"{API_URL}/flashback/{user_id}", params={"q": q, "k": k}, timeout=10)
+    r.raise_for_status()
+    return r.json()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_entries_page(user_id: str, offset: int) -> dict:
+    r = get_session().get(
+        f"{API_URL}/entry/{user_id}",
+        params={"offset": offset, "limit": ENTRIES_PAGE_SIZE},
+        timeout=10
+    )
+    r.raise_for_status()
+    return r.json()
+
+def clear_cached_reads():
+    """Drop cached reads after a save so stats, flashbacks and entries show it."""
+    fetch_stats.clear()
+    fetch_flashback.clear()
+    fetch_entries_page.clear()
+
+def load_concurrently(*calls):
+    """
+    Run independent (fn, *args) fetches in parallel threads.
+    Returns each call's result, or the exception it raised, in order.
+    """
+    ctx = get_script_run_ctx()
+
+    def run(fn, *args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            return fn(*args)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+        futures = [pool.submit(run, *call) for call in calls]
+        return [f.result() for f in futures]
+
 # -- Streamlit UI --
 st.set_page_config(page_title="Memory Capsule", page_icon=":memo:", layout="wide")
 
@@ -132,6 +193,11 @@ with st.sidebar:
     st.session_state.mode = st.radio("Mode", ["manual", "ai"])
     st.session_state.user_id = st.text_input("User ID", value="testuser")
 
+# Restart past-entry pagination when the user changes
+if st.session_state.get("entries_user") != st.session_state.user_id:
+    st.session_state.entries_user = st.session_state.user_id
+    st.session_state.entries_pages = 1
+
 st.header("New Entry")
 
 if st.session_state.mode == "manual":
@@ -168,16 +234,17 @@ if st.button("Save Entry"):
     
     with st.spinner("Saving your entry..."):
         try:
-            resp = requests.post(f"{API_URL}/entry", json=payload, timeout=60)
+            resp = get_session().post(f"{API_URL}/entry", json=payload, timeout=60)
             resp.raise_for_status()
             data = resp.json()
+            clear_cached_reads()
             st.success(f"Entry saved! ID: {data['entry_id']}")
             st.markdown("### Your Entry")
             st.write(data["text"])
             st.session_state.content = ""
             for q in QUESTIONS:
                 st.session_state.answers[q] = ""
-        except Exception as e:
+        except requests.HTTPError:
             # Show server-side validation errors
             try:
                 detail = resp.json()
@@ -200,13 +267,7 @@ with st.form("flashback_form"):
             st.error("Please enter a query.")
         else:
             try:
-                r2 = requests.get(
-                    f"{API_URL}/flashback/{st.session_state.user_id}",
-                    params={"q": flash_q, "k": k},
-                    timeout=10
-                )
-                r2.raise_for_status()
-                entries = r2.json()
+                entries = fetch_flashback(st.session_state.user_id, flash_q.strip(), k)
                 if not entries:
                     st.info("No flashbacks found.")
                 else:
@@ -216,15 +277,38 @@ with st.form("flashback_form"):
             except Exception as e:
                 st.error(f"Flashback failed: {e}")
 
-# -- Stats --
+# -- Stats & Past Entries --
+# Both panels are independent, so fetch them in parallel (cached pages return instantly)
+st.markdown("---")
+stats, *pages = load_concurrently(
+    (fetch_stats, st.session_state.user_id),
+    *[(fetch_entries_page, st.session_state.user_id, page * ENTRIES_PAGE_SIZE)
+      for page in range(st.session_state.entries_pages)],
+)
+
+st.header("Stats")
+if isinstance(stats, Exception):
+    st.error(f"Stats fetch failed: {stats}")
+else:
+    cols = st.columns(3)
+    cols[0].metric("Total Entries", stats["total_entries"])
+    cols[1].metric("Current Streak", stats["streak"])
+    cols[2].write("🏅 Badges: " + (", ".join(stats["badges"]) or "None"))
+
 st.markdown("---")
-if st.button("Show Stats"):
-    try:
-        r3 = requests.get(f"{API_URL}/stats/{st.session_state.user_id}", timeout=5)
-        r3.raise_for_status()
-        stats = r3.json()
-        st.metric("Total Entries", stats["total_entries"])
-        st.metric("Current Streak", stats["streak"])
-        st.write("🏅 Badges:", ", ".join(stats["badges"]) or "None")
-    except Exception as e:
-        st.error(f"Stats fetch failed: {e}")
+st.header("Past Entries")
+total = 0
+for page in pages:
+    if isinstance(page, Exception):
+        st.error(f"Entries fetch failed: {page}")
+        break
+    total = page["total"]
+    for e in page["entries"]:
+        with st.expander(e["entry_id"]):
+            st.write(e["content"])
+if total == 0 and not any(isinstance(p, Exception) for p in pages):
+    st.info("No entries yet.")
+elif st.session_state.entries_pages * ENTRIES_PAGE_SIZE < total:
+    if st.button("Load more"):
+        st.session_state.entries_pages += 1
+        st.rerun()
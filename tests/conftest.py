@@ -0,0 +1,31 @@
+import hashlib
+import itertools
+
+import numpy as np
+import pytest # type: ignore
+
+def fake_embed(text):
+    """Deterministic per-word embedding: texts sharing words land close together."""
+    from app import storage
+
+    def vec(t):
+        v = np.zeros(storage.EMBED_DIM, dtype="float32")
+        for word in t.lower().split():
+            seed = int(hashlib.md5(word.encode()).hexdigest()[:8], 16)
+            v += np.random.default_rng(seed).standard_normal(storage.EMBED_DIM).astype("float32")
+        return v / (np.linalg.norm(v) or 1)
+    return np.stack([vec(t) for t in text]) if isinstance(text, list) else vec(text)
+
+@pytest.fixture
+def capsule(tmp_path, monkeypatch):
+    """An empty capsule in a temp DATA_DIR, embedded offline with fake_embed."""
+    from app import storage
+
+    ids = (f"20250101T{i:06d}Z" for i in itertools.count())
+    monkeypatch.setattr(storage, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(storage, "INDEX_ENCODING", "flat")
+    monkeypatch.setattr(storage, "CHUNK_WORDS", 12)
+    monkeypatch.setattr(storage, "CHUNK_OVERLAP", 3)
+    monkeypatch.setattr(storage, "_generate_entry_id", lambda: next(ids))
+    monkeypatch.setattr(storage.embed_api, "feature_extraction", lambda text: fake_embed(text))
+    return "test_capsule"
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest # type: ignore
+
+from app.cache import ResultCache
+
+def test_hit_after_miss():
+    cache = ResultCache(maxsize=2)
+    calls = []
+    for _ in range(3):
+        assert cache.get_or_compute("a", lambda: calls.append(1) or "A") == "A"
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["hits"] == 2
+
+def test_lru_eviction():
+    cache = ResultCache(maxsize=2)
+    for key in ["a", "b", "a", "c"]:
+        cache.get_or_compute(key, lambda: key)
+    cache.get_or_compute("a", lambda: "recomputed")
+    cache.get_or_compute("b", lambda: "recomputed")
+    stats = cache.stats()
+    assert stats["evictions"] == 2 and stats["size"] == 2
+
+def test_concurrent_requests_coalesce():
+    cache = ResultCache(maxsize=8)
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(timeout=5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", slow))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    while cache.stats()["coalesced"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["value"] * 5
+
+def test_errors_are_not_cached():
+    cache = ResultCache(maxsize=8)
+
+    def boom():
+        raise ValueError("no index")
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute("k", boom)
+    assert cache.get_or_compute("k", lambda: "ok") == "ok"
+    assert cache.stats()["errors"] == 1
@@ -0,0 +1,44 @@
+import pytest # type: ignore
+
+from app import storage
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(storage, "CHUNK_WORDS", 4)
+    monkeypatch.setattr(storage, "CHUNK_OVERLAP", 1)
+
+def words_in(text, spans):
+    return [text[start:end].split() for start, end in spans]
+
+def test_windows_overlap_and_step(small_chunks):
+    text = " ".join(f"w{i}" for i in range(10))
+    assert words_in(text, storage._chunk_text(text)) == [
+        ["w0", "w1", "w2", "w3"],
+        ["w3", "w4", "w5", "w6"],
+        ["w6", "w7", "w8", "w9"],
+    ]
+
+def test_last_window_reaches_final_word(small_chunks):
+    text = "  alpha beta\ngamma  delta epsilon zeta\teta  "
+    spans = storage._chunk_text(text)
+    assert spans[-1][1] == len(text.rstrip())
+    assert text[slice(*spans[-1])].split()[-1] == "eta"
+    assert spans[0][0] == 2  # offsets start at the first word, not the leading whitespace
+
+def test_short_text_is_one_passage(small_chunks):
+    text = "just two"
+    assert storage._chunk_text(text) == [(0, len(text))]
+
+@pytest.mark.parametrize("text", ["", "   \n\t  "])
+def test_whitespace_only_is_one_span(small_chunks, text):
+    assert storage._chunk_text(text) == [(0, len(text))]
+
+@pytest.mark.parametrize("overlap", [4, 10])
+def test_overlap_not_smaller_than_window_terminates(monkeypatch, overlap):
+    monkeypatch.setattr(storage, "CHUNK_WORDS", 4)
+    monkeypatch.setattr(storage, "CHUNK_OVERLAP", overlap)
+    text = " ".join(f"w{i}" for i in range(8))
+    spans = storage._chunk_text(text)
+    # Falls back to a one-word step: every window starts one word later
+    assert [words[0] for words in words_in(text, spans)] == ["w0", "w1", "w2", "w3", "w4"]
+    assert text[slice(*spans[-1])].endswith("w7")
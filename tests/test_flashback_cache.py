@@ -0,0 +1,27 @@
+import pytest # type: ignore
+from fastapi import HTTPException # type: ignore
+
+from app import storage
+from app.cache import ResultCache
+from app.routers import flashback as flashback_router
+
+def test_embed_failure_is_not_cached(capsule, monkeypatch):
+    entry_id, *_ = storage.save_entry(capsule, "a quiet walk by the lake with friends")
+    cache = ResultCache(maxsize=8)
+    monkeypatch.setattr(flashback_router, "flashback_cache", cache)
+    working = storage.embed_api.feature_extraction
+
+    def outage(text):
+        raise ConnectionError("embedding endpoint down")
+
+    monkeypatch.setattr(storage.embed_api, "feature_extraction", outage)
+    with pytest.raises(HTTPException) as err:
+        flashback_router.flashback(capsule, q="lake", k=1, full=True)
+    assert err.value.status_code == 503
+    assert cache.stats()["errors"] == 1 and cache.stats()["size"] == 0
+
+    # Once embedding recovers, the same request computes afresh
+    monkeypatch.setattr(storage.embed_api, "feature_extraction", working)
+    results = flashback_router.flashback(capsule, q="lake", k=1, full=True)
+    assert [r["entry_id"] for r in results] == [entry_id]
+    assert cache.stats()["misses"] == 2 and cache.stats()["size"] == 1
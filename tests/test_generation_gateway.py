@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest # type: ignore
+
+from app.hf_client import CircuitBreaker, FakeProvider, GenerationGateway, GenerationUnavailable
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_gateway(provider, max_concurrency=2, max_queue=4, deadline_s=1.0, clock=None, **breaker_kwargs):
+    breaker_args = dict(window=10, min_calls=3, error_rate=0.5, slow_s=5.0, cooldown_s=30.0)
+    breaker_args.update(breaker_kwargs)
+    if clock is not None:
+        breaker_args["clock"] = clock
+    return GenerationGateway(provider, max_concurrency, max_queue, deadline_s, CircuitBreaker(**breaker_args))
+
+def test_generates_through_fake_provider():
+    gw = make_gateway(FakeProvider(latency_s=0.01))
+    text = asyncio.run(gw.generate("u1", "raw"))
+    assert "raw" in text
+    assert gw.stats()["completed"] == 1 and gw.stats()["active"] == 0
+
+def test_concurrency_is_bounded_and_excess_is_shed():
+    provider = FakeProvider(latency_s=0.05)
+    gw = make_gateway(provider, max_concurrency=2, max_queue=3)
+
+    async def run():
+        return await asyncio.gather(*[gw.generate(f"u{i}", "raw") for i in range(8)], return_exceptions=True)
+
+    results = asyncio.run(run())
+    shed = [r for r in results if isinstance(r, GenerationUnavailable)]
+    assert len(shed) == 3  # 2 running + 3 queued admitted, the rest shed
+    assert provider.calls == 5
+    stats = gw.stats()
+    assert stats["shed"] == 3 and stats["queue_depth"] == 0 and stats["active"] == 0
+
+def test_queue_is_fair_across_users():
+    order = []
+
+    async def provider(user_id, raw_block):
+        order.append(user_id)
+        await asyncio.sleep(0.01)
+        return raw_block
+
+    gw = make_gateway(provider, max_concurrency=1, max_queue=10)
+
+    async def run():
+        blocker = asyncio.ensure_future(gw.generate("first", "raw"))
+        await asyncio.sleep(0)
+        calls = [gw.generate("a", "raw") for _ in range(3)] + [gw.generate("b", "raw")]
+        await asyncio.gather(blocker, *calls)
+
+    asyncio.run(run())
+    assert order == ["first", "a", "b", "a", "a"]
+
+def test_deadline_fails_fast():
+    gw = make_gateway(FakeProvider(latency_s=1.0), deadline_s=0.05)
+    with pytest.raises(GenerationUnavailable):
+        asyncio.run(gw.generate("u1", "raw"))
+    assert gw.stats()["timed_out"] == 1
+
+def test_breaker_opens_on_errors_then_recovers():
+    clock = FakeClock()
+    provider = FakeProvider(latency_s=0, error_rate=1.0)
+    gw = make_gateway(provider, clock=clock)
+
+    async def attempts(n):
+        return await asyncio.gather(*[gw.generate("u1", "raw") for _ in range(n)], return_exceptions=True)
+
+    asyncio.run(attempts(3))
+    assert gw.stats()["breaker_state"] == "open"
+
+    results = asyncio.run(attempts(2))
+    assert all(isinstance(r, GenerationUnavailable) for r in results)
+    assert provider.calls == 3 and gw.stats()["rejected_open"] == 2
+
+    clock.now += 31  # cooldown elapsed: one probe goes through and closes the breaker
+    provider.error_rate = 0.0
+    asyncio.run(gw.generate("u1", "raw"))
+    assert gw.stats()["breaker_state"] == "closed"
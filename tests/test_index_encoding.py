@@ -0,0 +1,54 @@
+import faiss # type: ignore
+import numpy as np
+
+from app import storage
+from conftest import fake_embed
+
+def saved_passages(user_id):
+    """Passage texts in FAISS id order, rebuilt from the id and passage maps."""
+    id_map = storage._load_id_map(user_id, None)
+    passages = storage._load_passages(user_id)
+    texts = []
+    for idx in range(len(id_map)):
+        with open(f"{storage._entries_dir(user_id)}/{id_map[str(idx)]}.txt") as f:
+            start, end = passages[str(idx)]
+            texts.append(f.read()[start:end])
+    return texts
+
+def assert_same_order(index, expected):
+    """Each decoded vector is closest to the passage at the same FAISS id."""
+    decoded = index.reconstruct_n(0, index.ntotal)
+    dists = ((decoded[:, None, :] - expected[None, :, :]) ** 2).sum(-1)
+    np.testing.assert_array_equal(dists.argmin(axis=1), np.arange(index.ntotal))
+
+def test_index_migrates_to_int8_past_threshold(capsule, monkeypatch):
+    monkeypatch.setattr(storage, "INDEX_ENCODING", "int8")
+    monkeypatch.setitem(storage._ENCODING_MIN_VECTORS, "int8", 20)
+    rng = np.random.default_rng(0)
+    vocab = [f"w{i}" for i in range(40)]
+
+    def save():
+        storage.save_entry(capsule, " ".join(rng.choice(vocab, size=int(rng.integers(5, 30)))))
+        return faiss.read_index(storage._index_path(capsule))
+
+    index = save()
+    while index.ntotal < 20:
+        assert storage._index_encoding(index) == "flat"
+        index = save()
+
+    # Migrated: int8 scalar quantizer holding every vector, still in id_map order
+    assert isinstance(index, faiss.IndexScalarQuantizer)
+    assert storage._index_encoding(index) == "int8"
+    assert index.ntotal == len(storage._load_id_map(capsule, index))
+    assert_same_order(index, fake_embed(saved_passages(capsule)))
+
+    # Later saves only add vectors: no rebuild, same trained quantizer
+    trained = faiss.vector_to_array(index.sq.trained).copy()
+    builds = []
+    build_index = storage._build_index
+    monkeypatch.setattr(storage, "_build_index", lambda *a: builds.append(a) or build_index(*a))
+    index = save()
+    assert not builds
+    assert storage._index_encoding(index) == "int8"
+    np.testing.assert_array_equal(faiss.vector_to_array(index.sq.trained), trained)
+    assert_same_order(index, fake_embed(saved_passages(capsule)))
@@ -0,0 +1,28 @@
+import faiss # type: ignore
+import numpy as np
+import pytest # type: ignore
+
+from app import storage
+
+def neighbours_by_entry(graph):
+    return {
+        row["entry_id"].decode(): row["dist"][row["neighbors"] >= 0]
+        for row in graph
+    }
+
+def test_incremental_graph_matches_rebuild(capsule):
+    rng = np.random.default_rng(0)
+    vocab = [f"w{i}" for i in range(60)]
+    for i in range(80):
+        words = rng.choice(vocab, size=int(rng.integers(5, 30)))
+        storage.save_entry(capsule, " ".join(words))
+
+    incremental = storage._load_graph(capsule)
+    index = faiss.read_index(storage._index_path(capsule))
+    rebuilt = storage._build_related_graph(index, storage._load_id_map(capsule, index))
+
+    # Compare distances rather than ids, so ties may resolve either way
+    inc, full = neighbours_by_entry(incremental), neighbours_by_entry(rebuilt)
+    assert inc.keys() == full.keys()
+    for entry_id in full:
+        np.testing.assert_allclose(inc[entry_id], full[entry_id], rtol=1e-4, atol=1e-5)
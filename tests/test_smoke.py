@@ -31,6 +31,14 @@ def test_entry_modes(client, mode, payload_key):
     data = r.json()
     assert "entry_id" in data and "text" in data
 
+def test_list_entries(client):
+    r = client.get(f"/entry/{USER}", params={"offset": 0, "limit": 2})
+    assert r.status_code == 200
+    data = r.json()
+    assert data["total"] >= 1 and len(data["entries"]) <= 2
+    ids = [e["entry_id"] for e in data["entries"]]
+    assert ids == sorted(ids, reverse=True)
+
 def test_flashback(client):
     # Assuming at least one entry exists
     r = client.get(f"/flashback/{USER}", params={"q":"good", "k":2})
@@ -41,7 +49,63 @@ def test_flashback(client):
     # Each items should have 'entry_id' and 'content
     for item in data:
         assert "entry_id" in item and "content" in item
+
+def test_flashback_passages(client):
+    r = client.get(f"/flashback/{USER}", params={"q":"good", "k":2, "full":False})
+    assert r.status_code == 200
+    for item in r.json():
+        assert "content" not in item
+        assert item["passage_start"] <= item["passage_end"]
+        assert len(item["snippet"]) == item["passage_end"] - item["passage_start"]
     
+def test_flashback_batch(client):
+    queries = ["good", "day", "good"]
+    r = client.post(f"/flashback/{USER}/batch", json={"queries": queries, "k": 2})
+    assert r.status_code == 200
+    data = r.json()
+    assert [res["q"] for res in data["results"]] == queries
+    for res in data["results"]:
+        for item in res["results"]:
+            assert item["entry_id"] in data["entries"]
+    
+def test_flashback_cache(client):
+    params = {"q": "Good  Day", "k": 2}
+    first = client.get(f"/flashback/{USER}", params=params).json()
+    before = client.get("/flashback/cache/stats").json()
+    second = client.get(f"/flashback/{USER}", params={"q": "good day", "k": 2}).json()
+    after = client.get("/flashback/cache/stats").json()
+    assert first == second
+    assert after["hits"] == before["hits"] + 1
+    
+def test_related(client):
+    entry_id = client.get(f"/entry/{USER}", params={"limit": 1}).json()["entries"][0]["entry_id"]
+    r = client.get(f"/related/{USER}/{entry_id}", params={"k": 3})
+    assert r.status_code == 200
+    data = r.json()
+    assert len(data) <= 3
+    assert all(item["entry_id"] != entry_id for item in data)
+    assert [item["score"] for item in data] == sorted(item["score"] for item in data)
+
+def test_on_this_day(client):
+    r = client.get(f"/on-this-day/{USER}", params={"date": "2099-01-01"})
+    assert r.status_code == 200
+    assert all(item["date"].endswith("-01-01") and item["years_ago"] > 0 for item in r.json())
+
+def test_export_restore_roundtrip(client):
+    import io
+    import tarfile
+
+    r = client.get(f"/export/{USER}")
+    assert r.status_code == 200
+    archive = r.content
+    names = tarfile.open(fileobj=io.BytesIO(archive)).getnames()
+    assert "meta.json" in names and "index/faiss.index" in names
+
+    before = client.get(f"/stats/{USER}").json()
+    r = client.post(f"/export/{USER}/restore", content=archive)
+    assert r.status_code == 200
+    assert client.get(f"/stats/{USER}").json() == before
+
 def test_finetune(client):
     samples = [f"Sample line {i}" for i in range(10)]
     r = client.post(f"/tune/{USER}", json={"samples": samples})